@@ -1,9 +1,95 @@
 import sqlite3
+from datesDB import normalize_date
 
 db = sqlite3.connect("contacts.db")
+db.execute("PRAGMA auto_vacuum = INCREMENTAL")  # Only takes effect for a new database. See maintenanceDB.py
 db.execute("CREATE TABLE IF NOT EXISTS contacts(id INTEGER PRIMARY KEY NOT NULL, name TEXT NOT NULL, email TEXT, "
           "phone TEXT, address TEXT, photo BLOB, birth_date TEXT, occupation TEXT, notes TEXT)")
 
+# ----- Change log used by syncDB.py. Every change to "contacts" gets a new sequence number -----
+# Ids are local to each copy of the database, so syncDB.py matches contacts by a random uuid instead
+columns = [column[1] for column in db.execute("PRAGMA table_xinfo(contacts)")]
+if "uuid" not in columns:
+    db.execute("ALTER TABLE contacts ADD COLUMN uuid TEXT")
+for trigger in ("contacts_log_insert", "contacts_log_update", "contacts_log_photo_update", "contacts_log_delete"):
+    db.execute(f"DROP TRIGGER IF EXISTS {trigger}")  # Recreated below, so older versions get replaced
+
+db.execute("CREATE TABLE IF NOT EXISTS contacts_changelog(seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+           "contact_id INTEGER NOT NULL, contact_uuid TEXT, origin TEXT, operation TEXT NOT NULL, "
+           "photo_changed INTEGER NOT NULL)")
+changelog_columns = [column[1] for column in db.execute("PRAGMA table_info(contacts_changelog)")]
+if "contact_uuid" not in changelog_columns:
+    db.execute("ALTER TABLE contacts_changelog ADD COLUMN contact_uuid TEXT")
+if "origin" not in changelog_columns:
+    db.execute("ALTER TABLE contacts_changelog ADD COLUMN origin TEXT")
+
+# The uuids are random, so migrating several copies of the same database separately gives the same contact different
+# uuids. Migrate one copy and create the others from it with "syncDB.py init" instead
+db.execute("UPDATE contacts SET uuid = lower(hex(randomblob(16))) WHERE uuid IS NULL")
+db.execute("CREATE UNIQUE INDEX IF NOT EXISTS contacts_uuid ON contacts(uuid)")
+# Contacts from before the change log are logged as inserted, so exporting from sequence number 0 includes every contact
+db.execute("INSERT INTO contacts_changelog(contact_id, contact_uuid, operation, photo_changed) "
+           "SELECT id, uuid, 'insert', 1 FROM contacts WHERE NOT EXISTS (SELECT 1 FROM contacts_changelog AS log "
+           "WHERE log.contact_uuid = contacts.uuid)")
+db.execute("CREATE INDEX IF NOT EXISTS contacts_changelog_contact_id ON contacts_changelog(contact_id)")
+db.execute("CREATE TABLE IF NOT EXISTS sync_state(source TEXT PRIMARY KEY NOT NULL, last_seq INTEGER NOT NULL)")
+# Only has a row while syncDB.py applies a delta, so the triggers can tag the changes with where they came from
+db.execute("CREATE TABLE IF NOT EXISTS sync_applying(source TEXT NOT NULL)")
+
+log_str = "INSERT INTO contacts_changelog(contact_id, contact_uuid, origin, operation, photo_changed) " \
+          "VALUES ({0}.id, {0}.uuid, (SELECT source FROM sync_applying), '{1}', {2});"
+db.execute("CREATE TRIGGER contacts_log_insert AFTER INSERT ON contacts BEGIN "
+           "UPDATE contacts SET uuid = lower(hex(randomblob(16))) WHERE id = NEW.id AND uuid IS NULL; "
+           "INSERT INTO contacts_changelog(contact_id, contact_uuid, origin, operation, photo_changed) "
+           "VALUES (NEW.id, (SELECT uuid FROM contacts WHERE id = NEW.id), (SELECT source FROM sync_applying), "
+           "'insert', 1); END")
+# Setting the uuid of a new contact is not logged as an update. Photo changes get their own trigger, so the old
+# and new photos never have to be loaded to compare them
+db.execute("CREATE TRIGGER contacts_log_update AFTER UPDATE ON contacts WHEN OLD.uuid IS NOT NULL BEGIN "
+           + log_str.format("NEW", "update", 0) + " END")
+db.execute("CREATE TRIGGER contacts_log_photo_update AFTER UPDATE OF photo ON contacts BEGIN "
+           + log_str.format("NEW", "update", 1) + " END")
+db.execute("CREATE TRIGGER contacts_log_delete AFTER DELETE ON contacts BEGIN "
+           + log_str.format("OLD", "delete", 0) + " END")
+
+# ----- Birthday lookups. Month and day are derived from birth_date, and are NULL unless it is a valid YYYY-MM-DD date.
+# date() also reads texts like '1990' (a Julian day) and '1990-02-30', but those don't come back unchanged. The
+# '+0 days' modifier is needed for date() to roll invalid days like Feb 30 over into the next month -----
+birthday_str = "CASE WHEN date(birth_date, '+0 days') = birth_date THEN CAST(strftime('{}', birth_date) AS INTEGER) END"
+contacts_sql = db.execute("SELECT sql FROM sqlite_schema WHERE type = 'table' AND name = 'contacts'").fetchone()[0]
+if "birth_month" in columns and "date(birth_date, '+0 days') = birth_date" not in contacts_sql:
+    # Older versions derived the columns from any text SQLite could read as a date, so they are recreated
+    db.execute("DROP INDEX IF EXISTS contacts_birthday")
+    db.execute("ALTER TABLE contacts DROP COLUMN birth_month")
+    db.execute("ALTER TABLE contacts DROP COLUMN birth_day")
+    columns = [column[1] for column in db.execute("PRAGMA table_xinfo(contacts)")]
+if "birth_month" not in columns:
+    db.execute("ALTER TABLE contacts ADD COLUMN birth_month INTEGER "
+               f"GENERATED ALWAYS AS ({birthday_str.format('%m')}) VIRTUAL")
+if "birth_day" not in columns:
+    db.execute("ALTER TABLE contacts ADD COLUMN birth_day INTEGER "
+               f"GENERATED ALWAYS AS ({birthday_str.format('%d')}) VIRTUAL")
+db.execute("CREATE INDEX IF NOT EXISTS contacts_birthday ON contacts(birth_month, birth_day)")
+db.execute("CREATE INDEX IF NOT EXISTS contacts_birth_date ON contacts(birth_date)")
+
+# ----- Bulk edits. The old values are kept so a bulk edit can be undone -----
+db.execute("CREATE TABLE IF NOT EXISTS bulk_edits(id INTEGER PRIMARY KEY AUTOINCREMENT, field TEXT NOT NULL, "
+           "description TEXT NOT NULL, contact_count INTEGER NOT NULL, created TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)")
+# The value each bulk edit wrote is kept as well, so undo can leave contacts which were changed again alone
+db.execute("CREATE TABLE IF NOT EXISTS bulk_edit_undo(edit_id INTEGER NOT NULL, contact_id INTEGER NOT NULL, "
+           "old_value TEXT, new_value TEXT, PRIMARY KEY(edit_id, contact_id)) WITHOUT ROWID")
+if "new_value" not in [column[1] for column in db.execute("PRAGMA table_info(bulk_edit_undo)")]:
+    db.execute("ALTER TABLE bulk_edit_undo ADD COLUMN new_value TEXT")
+
+# Birth dates which aren't valid YYYY-MM-DD dates are converted where possible, for example if entered by hand
+for contact_id, birth_date in db.execute("SELECT id, birth_date FROM contacts WHERE birth_date IS NOT NULL "
+                                         "AND birth_date != '' AND birth_month IS NULL").fetchall():
+    try:
+        db.execute("UPDATE contacts SET birth_date = ? WHERE id = ?", (normalize_date(birth_date), contact_id))
+    except ValueError:
+        print(f"------! The birth date '{birth_date}' of contact {contact_id} isn't a valid date.")
+db.commit()
+
 
 # for row in db.execute("SELECT name, email, phone, address, birth_date, occupation, notes FROM contacts"):
 #     print(row)
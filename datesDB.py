@@ -0,0 +1,43 @@
+from datetime import date, datetime
+
+date_formats = ("%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%Y.%m.%d")
+
+
+def normalize_date(text: str) -> str:
+    """
+    Converts a date written in one of the accepted formats to the YYYY-MM-DD format used in the database \n
+    :param text: The date as text. An empty text is returned as it is.
+    :return: The date in the YYYY-MM-DD format
+    :raises ValueError: If the text isn't a valid date in any of the accepted formats
+    """
+    text = text.strip()
+    if text == "":
+        return text
+    for date_format in date_formats:
+        try:
+            return datetime.strptime(text, date_format).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    raise ValueError(f"'{text}' is not a valid date. Use the YYYY-MM-DD format.")
+
+
+def next_birthday(birth_date: date, today: date) -> date:
+    """Returns the next date on or after today which is the birthday. Feb 29 falls on Mar 1 in other years."""
+    try:
+        birthday = birth_date.replace(year=today.year)
+    except ValueError:
+        birthday = date(today.year, 3, 1)
+    if birthday < today:
+        try:
+            birthday = birth_date.replace(year=today.year + 1)
+        except ValueError:
+            birthday = date(today.year + 1, 3, 1)
+    return birthday
+
+
+def years_before(day: date, years: int) -> date:
+    """Returns the same date a number of years earlier. Feb 29 becomes Feb 28 in years which aren't leap years."""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
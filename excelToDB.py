@@ -1,10 +1,10 @@
 import sys
 import pandas as pd
 import sqlite3
-from modulesDB import convert_to_binary
+from modulesDB import is_nan, write_photo_to_db
 
-insert_str = "INSERT INTO contacts(name, email, phone, address, photo, birth_date, occupation, notes) " \
-             "VALUES(?, ?, ?, ?, ?, ?, ?, ?)"
+insert_str = "INSERT INTO contacts(name, email, phone, address, birth_date, occupation, notes) " \
+             "VALUES(?, ?, ?, ?, ?, ?, ?)"
 
 df = pd.read_excel("insert-contacts.xlsx") # Read the excel file and store it in a pandas Dataframe
 df["birth_date"] = df["birth_date"].dt.strftime(r'%Y-%m-%d') # Change date format to text to match database format
@@ -28,8 +28,14 @@ cursor = dbConn.cursor()
 
 # TODO: Account for duplicates
 for row in df.itertuples():
-    cursor.execute(insert_str, (row.name, row.email, row.phone, row.address, convert_to_binary(row.photo),
-                                row.birth_date, row.occupation, row.notes))
+    cursor.execute(insert_str, (row.name, row.email, row.phone, row.address, row.birth_date, row.occupation,
+                                row.notes))
+    # The photo is streamed from the file into the database in chunks instead of being read into memory first
+    if not is_nan(row.photo):
+        try:
+            write_photo_to_db(dbConn, cursor.lastrowid, row.photo)
+        except (FileNotFoundError, TypeError):
+            print(f"------! The provided path for '{row.photo}' doesn't work.")
 
 # Commit the changes to the table
 cursor.connection.commit()
@@ -0,0 +1,99 @@
+import argparse
+import sqlite3
+
+
+def space_report(db) -> dict:
+    """
+    Collects how the space in the database file is used \n
+    :param db: A sqlite3 connection to the contacts database
+    :return: A dict with the totals, the photo BLOBs and, if SQLite was built with the dbstat table, each table and index
+    """
+    page_size = db.execute("PRAGMA page_size").fetchone()[0]
+    report = {
+        "file_size": db.execute("PRAGMA page_count").fetchone()[0] * page_size,
+        "free_size": db.execute("PRAGMA freelist_count").fetchone()[0] * page_size,
+        "auto_vacuum": ("none", "full", "incremental")[db.execute("PRAGMA auto_vacuum").fetchone()[0]],
+    }
+    report["photo_count"], report["photo_size"], report["largest_photo"] = db.execute(
+        "SELECT COUNT(photo), IFNULL(SUM(length(photo)), 0), IFNULL(MAX(length(photo)), 0) FROM contacts").fetchone()
+
+    try:
+        # Overflow pages hold the parts of the photos which don't fit in the table's own pages
+        report["tables"] = db.execute("SELECT name, COUNT(*), SUM(pagetype = 'overflow'), SUM(pgsize), SUM(unused) "
+                                      "FROM dbstat GROUP BY name ORDER BY SUM(pgsize) DESC").fetchall()
+    except sqlite3.OperationalError:
+        report["tables"] = None  # This SQLite build doesn't have the dbstat virtual table
+    return report
+
+
+def print_space_report(report: dict, title: str):
+    print(f"----- {title} -----")
+    print(f"File size:\t{report['file_size'] / 1024:.1f} KiB, of which {report['free_size'] / 1024:.1f} KiB "
+          f"in free pages (auto_vacuum = {report['auto_vacuum']})")
+    print(f"Photos:\t\t{report['photo_count']} photos using {report['photo_size'] / 1024:.1f} KiB, the largest is "
+          f"{report['largest_photo'] / 1024:.1f} KiB")
+
+    if report["tables"] is None:
+        print("The per table sizes are not available in this SQLite build.\n")
+        return
+    print(f"{'Table or index':<32}{'Pages':>8}{'Overflow':>10}{'KiB':>10}{'Unused KiB':>12}")
+    for name, pages, overflow_pages, size, unused in report["tables"]:
+        print(f"{name:<32}{pages:>8}{overflow_pages:>10}{size / 1024:>10.1f}{unused / 1024:>12.1f}")
+    print()
+
+
+def run_maintenance(db, vacuum_pages: int = 0, full_check: bool = False, convert: bool = False) -> bool:
+    """
+    Checks the database, updates the query planner statistics and gives free pages back to the file system \n
+    :param db: A sqlite3 connection to the contacts database
+    :param vacuum_pages: The most free pages to remove. 0 removes all of them.
+    :param full_check: Run the slower "integrity_check" instead of "quick_check"
+    :param convert: Switch the database to auto_vacuum = INCREMENTAL. This rewrites the whole file once with VACUUM,
+                    which locks the database while it runs.
+    :return: True if the integrity check found no problems
+    """
+    check = "integrity_check" if full_check else "quick_check"
+    problems = [row[0] for row in db.execute(f"PRAGMA {check}").fetchall() if row[0] != "ok"]
+    if problems:
+        print(f"------! PRAGMA {check} found problems. Fix them or restore a backup before continuing:")
+        for problem in problems:
+            print("\t", problem)
+        return False
+    print(f"PRAGMA {check}: ok")
+
+    db.execute("ANALYZE")
+    db.execute("PRAGMA optimize")
+    db.commit()
+    print("Updated the query planner statistics.")
+
+    if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        if convert:
+            db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            db.execute("VACUUM")  # Changing auto_vacuum only takes effect after the file is rebuilt
+            print("Switched to auto_vacuum = INCREMENTAL.")
+        else:
+            print("------! auto_vacuum is not INCREMENTAL, so free pages can't be removed without a full VACUUM. "
+                  "Run with --convert once to switch.")
+            return True
+
+    # executescript runs the pragma to the end. With execute, only one page would be removed per call
+    db.executescript(f"PRAGMA incremental_vacuum({vacuum_pages});")
+    print("Removed free pages." if vacuum_pages == 0 else f"Removed up to {vacuum_pages} free pages.")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the contacts database, update its statistics and remove "
+                                                 "free pages.")
+    parser.add_argument("--db", default="contacts.db", help="The contacts database")
+    parser.add_argument("--vacuum-pages", type=int, default=0, help="The most free pages to remove. 0 removes all")
+    parser.add_argument("--full-check", action="store_true", help="Run the slower full integrity check")
+    parser.add_argument("--convert", action="store_true", help="Switch to auto_vacuum = INCREMENTAL with a one-time "
+                                                               "full VACUUM")
+    args = parser.parse_args()
+
+    dbConn = sqlite3.connect(args.db)
+    print_space_report(space_report(dbConn), "Before")
+    if run_maintenance(dbConn, args.vacuum_pages, args.full_check, args.convert):
+        print_space_report(space_report(dbConn), "After")
+    dbConn.close()
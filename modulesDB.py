@@ -1,26 +1,43 @@
-import io
+import calendar
+import os
+import shutil
 import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
 import tkinter as tk
 from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
 from tkinter import filedialog
+from datesDB import normalize_date, next_birthday, years_before
 
 text_font = ("Calibri", 12)
 bg_color = "white"
 inner_w_width = 1000
+close_vacuum_pages = 256  # Free pages removed from the database file each time the UI closes it
+close_busy_timeout = 200  # Milliseconds to wait for other programs before skipping the maintenance on close
+chunk_size = 64 * 1024  # Photos are copied between files and the database in pieces of this many bytes
+find_contact_str = "SELECT id, name, IFNULL(email, ''), IFNULL(phone, ''), IFNULL(address, ''), length(photo), " \
+                   "IFNULL(birth_date, ''), IFNULL(occupation, ''), IFNULL(notes, '') " \
+                   "FROM contacts WHERE name LIKE ? LIMIT 2"
+bulk_edit_fields = ("email", "phone", "address", "occupation", "notes")
+bulk_filter_fields = ("name", "email", "phone", "address", "birth_date", "occupation", "notes")
 
 
-def write_to_file(data: bytes, filename: str, filetype: str, save_path: str = ''):
+def write_to_file(data, filename: str, filetype: str, save_path: str = ''):
     """
     Saves data stored as bytes to the proper file format \n
-    :param data: The binary data to be stored
+    :param data: The binary data to be stored, either as bytes or as a file like object which is copied in chunks
     :param filename: Name of the file without file type.
     :param filetype: The type of file to be saved as without the period - 'png' etc.
     :param save_path: Optional relative or absolute path where picture should be stored
     """
     filename = save_path + filename + "." + filetype
     with open(filename, "wb") as file:
-        file.write(data)
+        if isinstance(data, bytes):
+            file.write(data)
+        else:
+            shutil.copyfileobj(data, file, chunk_size)
     print("Stored picture into:\t", filename, "\n")
 
 
@@ -34,21 +51,39 @@ def read_picture_from_db(cursor, contact_name: str, filetype: str, save_path: st
     :param save_path: Optional relative or absolute path where picture should be stored
     :return: None
     """
-    for name, photo in cursor.execute(f"SELECT name, photo FROM contacts WHERE photo IS NOT NULL AND name = ?",
-                                      (contact_name,)):
+    for contact_id, name in cursor.execute(f"SELECT id, name FROM contacts WHERE photo IS NOT NULL AND name = ?",
+                                           (contact_name,)).fetchall():
         name = save_path + name + ".png"
-        write_to_file(photo, name, filetype, save_path)
+        with open_photo_from_db(cursor.connection, contact_id) as photo:
+            write_to_file(photo, name, filetype, save_path)
 
 
-def convert_to_binary(filepath: str) -> bytes:
-    """Converts digital data to binary. Used for storing pictures etc. in database."""
-    try:
-        with open(filepath, "rb") as file:
-            blob_data = file.read()
-        return blob_data
-    except TypeError:
-        if not is_nan(filepath):
-            print(f"------! The provided path for '{filepath}' doesn't work.")
+def write_photo_to_db(db_connection, contact_id: int, filepath: str):
+    """
+    Stores a picture file as the photo of a contact, reading and writing it in chunks instead of all at once \n
+    The changes are not committed.
+
+    :param db_connection: A sqlite3 database connection
+    :param contact_id: The id of the contact
+    :param filepath: Path of the picture file
+    """
+    with open(filepath, "rb") as file:
+        # Reserve the space first, since incremental blob I/O can't change the size of the blob
+        db_connection.execute("UPDATE contacts SET photo = zeroblob(?) WHERE id = ?",
+                              (os.fstat(file.fileno()).st_size, contact_id))
+        with db_connection.blobopen("contacts", "photo", contact_id) as blob:
+            shutil.copyfileobj(file, blob, chunk_size)
+
+
+def open_photo_from_db(db_connection, contact_id: int, readonly: bool = True):
+    """
+    Opens the photo of a contact as a file like object which reads directly from the database \n
+    It can be passed to PIL's Image.open and should be closed after use, for example with a "with" statement.
+
+    :param db_connection: A sqlite3 database connection
+    :param contact_id: The id of the contact, who must have a photo
+    """
+    return db_connection.blobopen("contacts", "photo", contact_id, readonly=readonly)
 
 
 def is_nan(num):
@@ -102,70 +137,386 @@ class StartUpApp(tk.Tk):
 
 class ContactsContainer:
     def __init__(self):
+        self.id = None
         self.name = ""
         self.email = ""
         self.phone = ""
         self.address = ""
-        self.photo = None   # Stored as binary, not as path to the photo
+        self.photo_size = None  # Size of the photo in bytes, or None if there is no photo. Read with open_photo()
+        self.photo_path = None  # Set to the path of a picture file to store it as the new photo on the next save
         self.birth_date = ""
         self.occupation = ""
         self.notes = ""
+        self.photo_image = None  # The photo already decoded and resized for display, if it was prefetched
 
+        self.prefetcher = None  # Optional PhotoPrefetcher which get_contact will try first
         self._db_connection = None
         self._cursor = None
         self.name_list = self._get_all_names()
 
     def get_contact(self, search_name):
+        """
+        Loads the contact whose name matches the search into the container \n
+        If more than one contact matches, the container is left unchanged so the caller can let the user pick one
+        and load it with get_contact_by_id.
+
+        :param search_name: Whole or partial name of the contact
+        :return: True if more than one contact matched the search, otherwise False
+        """
+        prefetched = self.prefetcher.get(search_name) if self.prefetcher is not None else None
+        if prefetched is not None:
+            found_contacts, photo_image = prefetched
+        else:
+            if self._db_connection is None:
+                self.open_connection()
+
+            self._cursor = self._db_connection.cursor()
+            found_contacts = self._cursor.execute(find_contact_str, ("%" + search_name + "%",)).fetchall()
+            self._cursor.close()
+            photo_image = None
+
+        if len(found_contacts) == 1:
+            self._set_fields(found_contacts[0])
+            self.photo_image = photo_image
+        elif not found_contacts:
+            print("------! No contact was found. Either it doesn't exist or the name was misspelled.")
+        return len(found_contacts) > 1
+
+    def get_contact_by_id(self, contact_id):
+        """Loads the contact with the given id into the container."""
+        self.photo_image = None
+
         if self._db_connection is None:
             self.open_connection()
 
         self._cursor = self._db_connection.cursor()
 
-        sql_result = self._cursor.execute("SELECT name, IFNULL(email, ''), IFNULL(phone, ''), IFNULL(address, ''), photo,"
-                                          " IFNULL(birth_date, ''), IFNULL(occupation, ''), IFNULL(notes, '')"
-                                          " FROM contacts WHERE name LIKE ?", ("%" + search_name + "%",))
-        found_contacts = (x for x in sql_result)
+        found_contact = self._cursor.execute("SELECT id, name, IFNULL(email, ''), IFNULL(phone, ''),"
+                                             " IFNULL(address, ''), length(photo), IFNULL(birth_date, ''),"
+                                             " IFNULL(occupation, ''), IFNULL(notes, '')"
+                                             " FROM contacts WHERE id = ?", (contact_id,)).fetchone()
+
+        if found_contact is not None:
+            self._set_fields(found_contact)
+        else:
+            print(f"------! No contact with id {contact_id} was found.")
+
+        self._cursor.close()
+
+    def search_contacts(self, search_name, batch_size=50, max_results=1000):
+        """
+        Streams the contacts matching the search in batches without loading their photos \n
+        :param search_name: Whole or partial name of the contacts
+        :param batch_size: Number of rows fetched from the database at a time
+        :param max_results: Upper bound on the total number of rows yielded
+        :return: A generator yielding lists of (id, name, email, phone) tuples
+        """
+        if self._db_connection is None:
+            self.open_connection()
 
+        cursor = self._db_connection.cursor()
         try:
-            self.name, self.email, self.phone, self.address, self.photo, self.birth_date, \
-                self.occupation, self.notes = next(found_contacts)
-            try:
-                next(found_contacts)
-                print("------! More than one contact was found.")  # TODO: Create a popup window with all results?
-            except StopIteration:
-                pass
-        except StopIteration:
-            print("------! No contact was found. Either it doesn't exist or the name was misspelled.")
+            # Fetch one row past the cap so the caller can tell the result set was truncated
+            cursor.execute("SELECT id, name, IFNULL(email, ''), IFNULL(phone, '') FROM contacts"
+                           " WHERE name LIKE ? ORDER BY name, id LIMIT ?", ("%" + search_name + "%", max_results + 1))
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield batch
+        finally:
+            cursor.close()
+
+    def get_upcoming_birthdays(self, days=7, today=None):
+        """
+        Finds the contacts with a birthday in the coming days using the birthday index \n
+        :param days: How many days ahead to look, including today. At most one year.
+        :param today: The date to count from. Defaults to today's date.
+        :return: A list of (id, name, birth_date, next birthday, age on the next birthday) sorted by the next birthday
+        """
+        if self._db_connection is None:
+            self.open_connection()
+
+        today = today or date.today()
+        days = max(1, min(days, 366))
+        last_day = today + timedelta(days=days - 1)
+
+        start = (today.month, today.day)
+        if start == (3, 1) and not calendar.isleap(today.year):
+            start = (2, 29)  # Feb 29 birthdays are celebrated on Mar 1 in other years
+        end = (last_day.month, last_day.day)
+
+        # The month and day range is split in two when it wraps around new year, giving two index range scans
+        ranges = [(start, end)]
+        if days >= 365:
+            ranges = [((1, 1), (12, 31))]
+        elif end < start:
+            ranges = [(start, (12, 31)), ((1, 1), end)]
 
+        self._cursor = self._db_connection.cursor()
+        birthdays = []
+        for (start_month, start_day), (end_month, end_day) in ranges:
+            for contact_id, name, birth_date in self._cursor.execute(
+                    "SELECT id, name, birth_date FROM contacts "
+                    "WHERE (birth_month, birth_day) BETWEEN (?, ?) AND (?, ?)",
+                    (start_month, start_day, end_month, end_day)):
+                born = self._parse_birth_date(contact_id, birth_date)
+                if born is None:
+                    continue
+                birthday = next_birthday(born, today)
+                if birthday <= last_day:
+                    birthdays.append((contact_id, name, birth_date, birthday, birthday.year - born.year))
         self._cursor.close()
 
-    def update_contact(self, search_name):
+        birthdays.sort(key=lambda birthday: (birthday[3], birthday[1]))
+        return birthdays
+
+    def get_contacts_by_age(self, min_age, max_age, today=None):
+        """
+        Finds the contacts whose age is within a range using the birth date index \n
+        :param min_age: The lowest age, inclusive
+        :param max_age: The highest age, inclusive
+        :param today: The date to calculate the ages at. Defaults to today's date.
+        :return: A list of (id, name, birth_date, age) sorted from youngest to oldest
+        """
         if self._db_connection is None:
             self.open_connection()
 
+        today = today or date.today()
+
         self._cursor = self._db_connection.cursor()
+        # Someone is max_age until the day before they turn max_age + 1, and is min_age from their birthday. The bounds
+        # are calculated here, since SQLite's date() moves Feb 29 minus some years forward to Mar 1 instead of Feb 28
+        youngest, oldest = years_before(today, min_age), years_before(today, max_age + 1)
+        contacts = []
+        for contact_id, name, birth_date in self._cursor.execute(
+                "SELECT id, name, birth_date FROM contacts WHERE birth_date > ? AND birth_date <= ? "
+                "AND birth_month IS NOT NULL ORDER BY birth_date DESC", (oldest.isoformat(), youngest.isoformat())):
+            born = self._parse_birth_date(contact_id, birth_date)
+            if born is None:
+                continue
+            age = today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+            contacts.append((contact_id, name, birth_date, age))
+        self._cursor.close()
+        return contacts
 
-        self._cursor.execute("UPDATE contacts SET name = ?, email = ?, phone = ?, address = ?, photo = ?, "
-                             "birth_date = ?, occupation = ?, notes = ? WHERE name LIKE ?",
-                             (self.name, self.email, self.phone, self.address, self.photo, self.birth_date,
-                              self.occupation, self.notes, "%" + search_name + "%"))
+    @staticmethod
+    def _parse_birth_date(contact_id, birth_date):
+        # The birth_month and birth_day columns are only set for valid dates, but a database which createDB.py
+        # hasn't upgraded yet may still return others
+        try:
+            return date.fromisoformat(birth_date)
+        except (TypeError, ValueError):
+            print(f"------! The birth date '{birth_date}' of contact {contact_id} isn't a valid date. "
+                  f"Run createDB.py to fix the birth dates.")
+            return None
+
+    def preview_bulk_edit(self, filter_field, filter_text, field, value, find_text=None):
+        """
+        Counts the contacts a bulk edit would touch without changing anything \n
+        :return: A tuple with the number of contacts matching the filter and the number that would be changed
+        """
+        if self._db_connection is None:
+            self.open_connection()
 
-        self._cursor.connection.commit()
+        filter_str, filter_params = self._bulk_filter(filter_field, filter_text)
+        change_str, change_params = self._bulk_change_filter(field, value, find_text)
+
+        self._cursor = self._db_connection.cursor()
+        matching, affected = self._cursor.execute(
+            f"SELECT COUNT(*), IFNULL(SUM({change_str}), 0) FROM contacts WHERE {filter_str}",
+            (*change_params, *filter_params)).fetchone()
         self._cursor.close()
+        return matching, affected
+
+    def bulk_edit(self, filter_field, filter_text, field, value, find_text=None, progress=None, batch_size=500):
+        """
+        Changes a field for every contact matching a filter in a single transaction \n
+        Without find_text the field is set to value, otherwise every occurrence of find_text in the field is replaced
+        with value. The old values are saved so the edit can be undone with undo_bulk_edit.
+
+        :param filter_field: The field to filter on, one of bulk_filter_fields
+        :param filter_text: Text the filter field must contain. An empty text matches every contact.
+        :param field: The field to change, one of bulk_edit_fields
+        :param value: The new value, or the replacement text if find_text is given
+        :param find_text: Optional text to replace
+        :param progress: Optional function called with (contacts done, contacts in total) after every batch
+        :param batch_size: Number of contacts changed per statement
+        :return: A tuple with the id of the bulk edit, which is None if nothing changed, and the number of contacts
+        """
+        if self._db_connection is None:
+            self.open_connection()
 
-    def create_contact(self):
+        filter_str, filter_params = self._bulk_filter(filter_field, filter_text)
+        change_str, change_params = self._bulk_change_filter(field, value, find_text)
+        where_str, where_params = f"{filter_str} AND {change_str}", (*filter_params, *change_params)
+
+        if find_text:
+            new_str, new_params = f"REPLACE({field}, ?, ?)", (find_text, value)
+            description = f"Replaced '{find_text}' with '{value}' in {field} where {filter_field} contains " \
+                          f"'{filter_text}'"
+        else:
+            new_str, new_params = "?", (value,)
+            description = f"Set {field} to '{value}' where {filter_field} contains '{filter_text}'"
+
+        self._cursor = self._db_connection.cursor()
+        with self._db_connection:  # Commits everything at once, or rolls back if anything fails
+            ids = [row[0] for row in self._cursor.execute(f"SELECT id FROM contacts WHERE {where_str} ORDER BY id",
+                                                          where_params)]
+            if not ids:
+                self._cursor.close()
+                return None, 0
+
+            self._cursor.execute("INSERT INTO bulk_edits(field, description, contact_count) VALUES (?, ?, ?)",
+                                 (field, description, len(ids)))
+            edit_id = self._cursor.lastrowid
+
+            # The contacts are changed in id ranges so every statement stays small and progress can be reported
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                range_params = (batch[0], batch[-1], *where_params)
+                self._cursor.execute(f"INSERT INTO bulk_edit_undo(edit_id, contact_id, old_value, new_value) "
+                                     f"SELECT ?, id, {field}, {new_str} FROM contacts "
+                                     f"WHERE id BETWEEN ? AND ? AND {where_str}", (edit_id, *new_params, *range_params))
+                self._cursor.execute(f"UPDATE contacts SET {field} = {new_str} "
+                                     f"WHERE id BETWEEN ? AND ? AND {where_str}", (*new_params, *range_params))
+                if progress is not None:
+                    progress(start + len(batch), len(ids))
+
+        self._cursor.close()
+        self._clear_prefetched()
+        return edit_id, len(ids)
+
+    def get_bulk_edits(self, limit=20):
+        """Returns the latest bulk edits which can be undone as a list of (id, description, contact_count, created)."""
         if self._db_connection is None:
             self.open_connection()
 
         self._cursor = self._db_connection.cursor()
+        bulk_edits = self._cursor.execute("SELECT id, description, contact_count, created FROM bulk_edits "
+                                          "ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        self._cursor.close()
+        return bulk_edits
+
+    def undo_bulk_edit(self, edit_id):
+        """
+        Restores the values a bulk edit changed \n
+        Contacts whose field was changed again after the bulk edit, by hand or by a newer bulk edit, are left alone
+        so the newer change isn't lost. Their old values are kept, and the bulk edit is only forgotten once every
+        contact is restored, so it can be undone again after the newer bulk edit is undone.
+
+        :param edit_id: The id returned by bulk_edit
+        :return: A tuple with the number of contacts restored and the number skipped because they changed since
+        """
+        if self._db_connection is None:
+            self.open_connection()
 
-        self._cursor.execute("INSERT INTO contacts (name, email, phone, address, photo, "
-                             "birth_date, occupation, notes) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                             (self.name, self.email, self.phone, self.address, self.photo, self.birth_date,
-                              self.occupation, self.notes))
+        self._cursor = self._db_connection.cursor()
+        with self._db_connection:
+            found_edit = self._cursor.execute("SELECT field FROM bulk_edits WHERE id = ?", (edit_id,)).fetchone()
+            if found_edit is None:
+                print(f"------! No bulk edit with id {edit_id} was found.")
+                self._cursor.close()
+                return 0, 0
+
+            field = found_edit[0]
+            if field not in bulk_edit_fields:
+                raise ValueError(f"The field '{field}' can't be bulk edited.")
+
+            # Only contacts still holding the value the bulk edit wrote are restored
+            self._cursor.execute(f"UPDATE contacts SET {field} = (SELECT old_value FROM bulk_edit_undo "
+                                 f"WHERE edit_id = ? AND contact_id = contacts.id) "
+                                 f"WHERE id IN (SELECT contact_id FROM bulk_edit_undo WHERE edit_id = ?) "
+                                 f"AND {field} IS (SELECT new_value FROM bulk_edit_undo "
+                                 f"WHERE edit_id = ? AND contact_id = contacts.id)",
+                                 (edit_id, edit_id, edit_id))
+            restored = self._cursor.rowcount
+            # The old values are only forgotten for contacts which hold them again or don't exist anymore
+            self._cursor.execute(f"DELETE FROM bulk_edit_undo WHERE edit_id = ? AND NOT EXISTS (SELECT 1 FROM contacts "
+                                 f"WHERE id = bulk_edit_undo.contact_id AND {field} IS NOT bulk_edit_undo.old_value)",
+                                 (edit_id,))
+            skipped = self._cursor.execute("SELECT COUNT(*) FROM bulk_edit_undo WHERE edit_id = ?",
+                                           (edit_id,)).fetchone()[0]
+            if skipped:
+                self._cursor.execute("UPDATE bulk_edits SET contact_count = ? WHERE id = ?", (skipped, edit_id))
+            else:
+                self._cursor.execute("DELETE FROM bulk_edits WHERE id = ?", (edit_id,))
 
-        self._cursor.connection.commit()
         self._cursor.close()
+        self._clear_prefetched()
+        return restored, skipped
+
+    @staticmethod
+    def _bulk_filter(filter_field, filter_text):
+        if filter_field not in bulk_filter_fields:
+            raise ValueError(f"Can't filter on the field '{filter_field}'.")
+        # % and _ in the text are matched literally instead of as wildcards
+        escaped_text = filter_text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"IFNULL({filter_field}, '') LIKE ? ESCAPE '\\'", ("%" + escaped_text + "%",)
+
+    @staticmethod
+    def _bulk_change_filter(field, value, find_text):
+        # Only the contacts whose value would actually change are counted and touched
+        if field not in bulk_edit_fields:
+            raise ValueError(f"The field '{field}' can't be bulk edited.")
+        if find_text:
+            return f"(instr({field}, ?) > 0)", (find_text,)
+        return f"({field} IS NOT ?)", (value,)
+
+    def update_contact(self, search_name):
+        if self._db_connection is None:
+            self.open_connection()
+
+        self._cursor = self._db_connection.cursor()
+
+        try:
+            # The photo is left alone unless a new one was chosen, so it isn't copied back and forth on every edit
+            with self._db_connection:  # Commits the contact and photo together, or nothing if the photo can't be read
+                if self.id is not None:
+                    self._cursor.execute("UPDATE contacts SET name = ?, email = ?, phone = ?, address = ?, "
+                                         "birth_date = ?, occupation = ?, notes = ? WHERE id = ?",
+                                         (self.name, self.email, self.phone, self.address, self.birth_date,
+                                          self.occupation, self.notes, self.id))
+                    contact_ids = [self.id]
+                else:
+                    contact_ids = [row[0] for row in self._cursor.execute("SELECT id FROM contacts WHERE name LIKE ?",
+                                                                          ("%" + search_name + "%",)).fetchall()]
+                    self._cursor.execute("UPDATE contacts SET name = ?, email = ?, phone = ?, address = ?, "
+                                         "birth_date = ?, occupation = ?, notes = ? WHERE name LIKE ?",
+                                         (self.name, self.email, self.phone, self.address, self.birth_date,
+                                          self.occupation, self.notes, "%" + search_name + "%"))
+
+                if self.photo_path is not None:
+                    for contact_id in contact_ids:
+                        write_photo_to_db(self._db_connection, contact_id, self.photo_path)
+        finally:
+            self.photo_path = None  # A photo that failed to be stored must not be tried again on the next save
+            self._cursor.close()
+        self._clear_prefetched()
+
+    def create_contact(self):
+        if self._db_connection is None:
+            self.open_connection()
+
+        self._cursor = self._db_connection.cursor()
+
+        try:
+            with self._db_connection:  # Commits the contact and photo together, or nothing if the photo can't be read
+                self._cursor.execute("INSERT INTO contacts (name, email, phone, address, "
+                                     "birth_date, occupation, notes) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                     (self.name, self.email, self.phone, self.address, self.birth_date,
+                                      self.occupation, self.notes))
+
+                if self.photo_path is not None:
+                    write_photo_to_db(self._db_connection, self._cursor.lastrowid, self.photo_path)
+        finally:
+            self.photo_path = None
+            self._cursor.close()
+        self._clear_prefetched()
+
+    def open_photo(self):
+        """Opens the photo of the loaded contact as a file like object reading directly from the database."""
+        return open_photo_from_db(self._db_connection, self.id)
 
     def _get_all_names(self):
         if self._db_connection is None:
@@ -180,14 +531,116 @@ class ContactsContainer:
         self._cursor.close()
         return name_list
 
+    def _clear_prefetched(self):
+        if self.prefetcher is not None:
+            self.prefetcher.clear()
+
+    def _set_fields(self, row):
+        self.id, self.name, self.email, self.phone, self.address, self.photo_size, self.birth_date, \
+            self.occupation, self.notes = row
+
     def open_connection(self):
         self._db_connection = sqlite3.connect("contacts.db")
 
     def close_connection(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()  # Waits for its thread, which would otherwise keep the database busy
+
+        # Light maintenance on every close. maintenanceDB.py does the rest, like ANALYZE and integrity checks.
+        # The vacuum needs a write lock, so it is skipped if another program is using the database
+        try:
+            self._db_connection.execute(f"PRAGMA busy_timeout = {close_busy_timeout}")
+            self._db_connection.execute("PRAGMA optimize")
+            self._db_connection.executescript(f"PRAGMA incremental_vacuum({close_vacuum_pages});")
+        except sqlite3.OperationalError as error:
+            print(f"------! Skipped the database maintenance on close: {error}")
         self._db_connection.close()
         self._db_connection = None
 
 
+class PhotoPrefetcher:
+    def __init__(self, max_size=32, db_path="contacts.db"):
+        """
+        Looks up contacts and decodes their photos in a background thread before they are selected \n
+        :param max_size: The highest number of looked up contacts kept in memory
+        :param db_path: Path of the contacts database. The thread uses its own connection.
+        """
+        self.max_size = max_size
+        self.db_path = db_path
+
+        self._cache = OrderedDict()  # Search text -> (found rows, display-size photo). Oldest first
+        self._pending = []  # Search texts waiting to be looked up, most likely to be selected first
+        self._generation = 0  # Increased by clear() so lookups running during a clear are thrown away
+        self._closed = False
+        self._condition = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def prefetch(self, search_names):
+        """Replaces the waiting lookups with the given search texts, which are looked up in order."""
+        with self._condition:
+            self._pending = [name for name in search_names if name not in self._cache]
+            self._condition.notify()
+
+    def get(self, search_name):
+        """Returns the prefetched (found rows, display-size photo) for a search text, or None if not prefetched."""
+        with self._condition:
+            prefetched = self._cache.get(search_name)
+            if prefetched is not None:
+                self._cache.move_to_end(search_name)
+            return prefetched
+
+    def clear(self):
+        """Forgets everything prefetched. Must be called when contacts are changed."""
+        with self._condition:
+            self._cache.clear()
+            self._pending = []
+            self._generation += 1
+
+    def close(self):
+        """Stops the thread and waits for it to close its database connection."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        db_connection = sqlite3.connect(self.db_path)
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    break
+                search_name = self._pending.pop(0)
+                generation = self._generation
+                if search_name in self._cache:
+                    continue
+
+            found_contacts = db_connection.execute(find_contact_str, ("%" + search_name + "%",)).fetchall()
+            photo_image = None
+            if found_contacts and found_contacts[0][5] is not None:
+                photo_image = self._decode_photo(db_connection, found_contacts[0][0])
+
+            with self._condition:
+                if generation == self._generation:
+                    self._cache[search_name] = (found_contacts, photo_image)
+                    while len(self._cache) > self.max_size:
+                        self._cache.popitem(last=False)
+        db_connection.close()
+
+    @staticmethod
+    def _decode_photo(db_connection, contact_id):
+        # Photo images must be created by tkinter in the main thread, so only the decoding and resizing is done here
+        try:
+            with open_photo_from_db(db_connection, contact_id) as photo:
+                img = Image.open(photo)
+                return img.resize(set_img_size(*img.size))
+        except Exception:  # An error here would stop the thread, so let the main thread try again and report it
+            return None
+
+
 class VerticalScrolledFrame(tk.Frame):
     def __init__(self, parent, bg=bg_color, *args, **kw):
         super().__init__(parent, bg=bg, *args, **kw)
@@ -237,10 +690,20 @@ class VerticalScrolledFrame(tk.Frame):
 
 
 class CustomComboBox(ttk.Combobox):
-    def __init__(self, parent, name_list, **kwargs):
+    def __init__(self, parent, name_list, on_suggest=None, prefetch_count=5, **kwargs):
         super().__init__(parent, **kwargs)
 
         self.name_list = name_list
+        self.on_suggest = on_suggest  # Called with the suggestions most likely to be selected next
+        self.prefetch_count = prefetch_count
+
+        if self.on_suggest is not None:
+            # The dropdown list is created by Tcl, so its highlight events are bound through Tcl as well
+            self._listbox = str(self.tk.call("ttk::combobox::PopdownWindow", self)) + ".f.l"
+            highlight_command = self.register(self._on_highlight)
+            self.tk.call("bind", self._listbox, "<<ListboxSelect>>", "+" + highlight_command)
+            # Widget bindings run before the class binding which moves the highlight, so the row is read from %y
+            self.tk.call("bind", self._listbox, "<Motion>", "+" + highlight_command + " %y")
 
         self.configure(postcommand=lambda: self._on_enter(None))
 
@@ -260,11 +723,29 @@ class CustomComboBox(ttk.Combobox):
         name_contains = set(name_contains)  # Remove duplicates
 
         self.configure(values=tuple(name_contains))
+        if self.on_suggest is not None:
+            self.on_suggest(list(name_contains)[:self.prefetch_count])
 
         self.configure(postcommand="")  # Need to temporary disable the postcommand or it will cause a recursion hang
         self.event_generate("<Button-1>")
         self.configure(postcommand=lambda: self._on_enter(None))
 
+    def _on_highlight(self, y=None):
+        if y is not None:  # The mouse moved over the row at this height
+            index = int(self.tk.call(self._listbox, "nearest", y))
+        else:
+            selection = self.tk.splitlist(self.tk.call(self._listbox, "curselection"))
+            if not selection:
+                return
+            index = int(selection[0])
+        if index < 0:
+            return
+
+        # The highlighted suggestion first, then the ones the user is most likely to move to next
+        values = self.tk.splitlist(self.cget("values"))
+        nearby = [index, index + 1, index - 1, index + 2]
+        self.on_suggest([values[i] for i in nearby if 0 <= i < len(values)])
+
 
 class ContactTextWidget(tk.Text):
     def __init__(self, parent, text=None, width=120, height=2, borderwidth=0, bg=bg_color, wrap="word", *args, **kwargs):
@@ -313,6 +794,369 @@ class ConfirmPopUp:
         self.top.destroy()
 
 
+class ResultPickerPopUp:
+    def __init__(self, master, contact, search_name, page_size=100, batch_size=25, max_results=1000,
+                 bg=bg_color, font=text_font):
+        self.top = tk.Toplevel(master, bg=bg)
+        self.top.title("Select contact")
+        self.master = master
+
+        self.page_size = page_size
+        self.max_results = max_results
+        self.result = None  # The id of the chosen contact
+        self._shown = 0
+        self._page_end = 0
+        self._batches = contact.search_contacts(search_name, batch_size=batch_size, max_results=max_results)
+        self._exhausted = False
+
+        self.label = tk.Label(self.top, bg=bg, text="More than one contact was found. Select the right one:",
+                              font=font)
+        self.label.pack(padx=10, pady=10)
+
+        style = ttk.Style()
+        style.configure(".", font=text_font, background=bg_color)
+
+        # ----- Result list, the photos are never loaded here -----
+        self.tree_frame = tk.Frame(self.top, bg=bg)
+        self.tree_frame.pack(fill="both", expand=True, padx=10)
+
+        self.tree = ttk.Treeview(self.tree_frame, columns=("name", "email", "phone"), show="headings",
+                                 selectmode="browse", height=15)
+        self.tree.heading("name", text="Name")
+        self.tree.heading("email", text="Email")
+        self.tree.heading("phone", text="Phone number")
+        self.tree.column("name", width=300)
+        self.tree.column("email", width=300)
+        self.tree.column("phone", width=180)
+        scrollbar = ttk.Scrollbar(self.tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.status_label = tk.Label(self.top, bg=bg, text="", font=font)
+        self.status_label.pack(padx=10, pady=5)
+
+        self.button_frame = tk.Frame(self.top, bg=bg)
+        self.button_frame.pack()
+
+        self.open_button = ttk.Button(self.button_frame, text="Open", width=10, command=self._open_command)
+        self.open_button.pack(side="left", padx=10, pady=10)
+        self.more_button = ttk.Button(self.button_frame, text="Show more", width=10, command=self._load_page)
+        self.more_button.pack(side="left", padx=10, pady=10)
+        self.cancel_button = ttk.Button(self.button_frame, text="Cancel", width=10, command=self._cancel_command)
+        self.cancel_button.pack(side="right", padx=10, pady=10)
+
+        self.top.geometry("+600+250")
+        self.top.protocol("WM_DELETE_WINDOW", self._cancel_command)
+
+        self.top.bind_class("TButton", "<Return>", lambda event: event.widget.invoke())
+        self.tree.bind("<Double-1>", lambda event: self._open_command())
+        self.tree.bind("<Return>", lambda event: self._open_command())
+        self.tree.focus()
+
+        self._load_page()
+
+    def _load_page(self):
+        self._page_end = min(self._shown + self.page_size, self.max_results)
+        self.more_button.configure(state="disabled")
+        self._load_batch()
+
+    def _load_batch(self):
+        # Insert one batch at a time and yield to the event loop in between so the window stays responsive
+        if self._shown < self._page_end and not self._exhausted:
+            try:
+                batch = next(self._batches)
+            except StopIteration:
+                self._exhausted = True
+                batch = []
+
+            for contact_id, name, email, phone in batch:
+                if self._shown >= self.max_results:
+                    self._show_truncated()
+                    return
+                self.tree.insert("", "end", iid=str(contact_id), values=(name, email, phone))
+                self._shown += 1
+                if self._shown == 1:
+                    self.tree.selection_set(str(contact_id))
+                    self.tree.focus(str(contact_id))
+
+            if self._shown < self._page_end and not self._exhausted:
+                self.top.after(1, self._load_batch)
+                return
+
+        if self._shown >= self.max_results and not self._exhausted and next(self._batches, None):
+            self._show_truncated()
+            return
+
+        self.status_label.configure(text=f"Showing {self._shown} contacts.")
+        if not self._exhausted and self._shown < self.max_results:
+            self.more_button.configure(state="normal")
+
+    def _show_truncated(self):
+        # The search fetches one row past the cap, so getting here means there are more matches than shown
+        self._exhausted = True
+        self._batches.close()
+        self.status_label.configure(text=f"Showing the first {self.max_results} contacts. "
+                                         f"Refine the search to narrow down the results.")
+
+    def _open_command(self):
+        selection = self.tree.selection()
+        if selection:
+            self.result = int(selection[0])
+            self._close()
+
+    def _cancel_command(self):
+        self._close()
+
+    def _close(self):
+        self._batches.close()  # Releases the cursor if the results were not fully read
+        self.top.destroy()
+
+
+class BirthdaysPopUp:
+    def __init__(self, master, contact, bg=bg_color, font=text_font):
+        self.top = tk.Toplevel(master, bg=bg)
+        self.top.title("Birthdays")
+        self.master = master
+        self.contact = contact
+        self.result = None  # The id of the chosen contact
+
+        style = ttk.Style()
+        style.configure(".", font=text_font, background=bg_color)
+
+        # ----- Query fields -----
+        self.query_frame = tk.Frame(self.top, bg=bg)
+        self.query_frame.pack(padx=10, pady=10)
+
+        tk.Label(self.query_frame, bg=bg, text="Birthdays in the next", font=font).grid(row=0, column=0, sticky="w")
+        self.days_spinbox = ttk.Spinbox(self.query_frame, from_=1, to=366, width=5, font=font)
+        self.days_spinbox.set(7)
+        self.days_spinbox.grid(row=0, column=1, padx=5)
+        tk.Label(self.query_frame, bg=bg, text="days", font=font).grid(row=0, column=2, sticky="w")
+        self.upcoming_button = ttk.Button(self.query_frame, text="Show", width=10, command=self._show_upcoming)
+        self.upcoming_button.grid(row=0, column=4, padx=10, pady=5)
+
+        tk.Label(self.query_frame, bg=bg, text="Aged from", font=font).grid(row=1, column=0, sticky="w")
+        self.min_age_spinbox = ttk.Spinbox(self.query_frame, from_=0, to=150, width=5, font=font)
+        self.min_age_spinbox.set(0)
+        self.min_age_spinbox.grid(row=1, column=1, padx=5)
+        tk.Label(self.query_frame, bg=bg, text="to", font=font).grid(row=1, column=2, sticky="w")
+        self.max_age_spinbox = ttk.Spinbox(self.query_frame, from_=0, to=150, width=5, font=font)
+        self.max_age_spinbox.set(150)
+        self.max_age_spinbox.grid(row=1, column=3, padx=5)
+        self.age_button = ttk.Button(self.query_frame, text="Show", width=10, command=self._show_age_range)
+        self.age_button.grid(row=1, column=4, padx=10, pady=5)
+
+        # ----- Result list -----
+        self.tree_frame = tk.Frame(self.top, bg=bg)
+        self.tree_frame.pack(fill="both", expand=True, padx=10)
+
+        self.tree = ttk.Treeview(self.tree_frame, columns=("name", "birth_date", "info"), show="headings",
+                                 selectmode="browse", height=15)
+        self.tree.heading("name", text="Name")
+        self.tree.heading("birth_date", text="Birth date")
+        self.tree.heading("info", text="")
+        self.tree.column("name", width=300)
+        self.tree.column("birth_date", width=150)
+        self.tree.column("info", width=250)
+        scrollbar = ttk.Scrollbar(self.tree_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.button_frame = tk.Frame(self.top, bg=bg)
+        self.button_frame.pack()
+
+        self.open_button = ttk.Button(self.button_frame, text="Open", width=10, command=self._open_command)
+        self.open_button.pack(side="left", padx=10, pady=10)
+        self.close_button = ttk.Button(self.button_frame, text="Close", width=10, command=self.top.destroy)
+        self.close_button.pack(side="right", padx=10, pady=10)
+
+        self.top.geometry("+600+250")
+
+        self.top.bind_class("TButton", "<Return>", lambda event: event.widget.invoke())
+        self.tree.bind("<Double-1>", lambda event: self._open_command())
+        self.tree.bind("<Return>", lambda event: self._open_command())
+        self.upcoming_button.focus()
+
+        self._show_upcoming()
+
+    def _show_upcoming(self):
+        try:
+            days = int(self.days_spinbox.get())
+        except ValueError:
+            return
+
+        self.tree.heading("info", text="Birthday")
+        self.tree.delete(*self.tree.get_children())
+        for contact_id, name, birth_date, birthday, age in self.contact.get_upcoming_birthdays(days):
+            self.tree.insert("", "end", iid=str(contact_id),
+                             values=(name, birth_date, f"{birthday.strftime('%d %b')} - turns {age}"))
+
+    def _show_age_range(self):
+        try:
+            min_age, max_age = int(self.min_age_spinbox.get()), int(self.max_age_spinbox.get())
+        except ValueError:
+            return
+
+        self.tree.heading("info", text="Age")
+        self.tree.delete(*self.tree.get_children())
+        for contact_id, name, birth_date, age in self.contact.get_contacts_by_age(min_age, max_age):
+            self.tree.insert("", "end", iid=str(contact_id), values=(name, birth_date, age))
+
+    def _open_command(self):
+        selection = self.tree.selection()
+        if selection:
+            self.result = int(selection[0])
+            self.top.destroy()
+
+
+class BulkEditPopUp:
+    def __init__(self, master, contact, bg=bg_color, font=text_font):
+        self.top = tk.Toplevel(master, bg=bg)
+        self.top.title("Bulk edit")
+        self.master = master
+        self.contact = contact
+        self.changed = False  # True if any contact was changed or restored
+
+        style = ttk.Style()
+        style.configure(".", font=text_font, background=bg_color)
+
+        # ----- Filter and change fields -----
+        self.fields_frame = tk.Frame(self.top, bg=bg)
+        self.fields_frame.pack(padx=10, pady=10)
+
+        tk.Label(self.fields_frame, bg=bg, text="Contacts where", font=font).grid(row=0, column=0, sticky="w")
+        self.filter_field_box = ttk.Combobox(self.fields_frame, values=bulk_filter_fields, state="readonly",
+                                             width=12, font=font)
+        self.filter_field_box.set("name")
+        self.filter_field_box.grid(row=0, column=1, padx=5, pady=5)
+        tk.Label(self.fields_frame, bg=bg, text="contains", font=font).grid(row=0, column=2, sticky="w")
+        self.filter_entry = ttk.Entry(self.fields_frame, width=40, font=font)
+        self.filter_entry.grid(row=0, column=3, padx=5, pady=5)
+
+        tk.Label(self.fields_frame, bg=bg, text="Change", font=font).grid(row=1, column=0, sticky="w")
+        self.field_box = ttk.Combobox(self.fields_frame, values=bulk_edit_fields, state="readonly", width=12,
+                                      font=font)
+        self.field_box.set("occupation")
+        self.field_box.grid(row=1, column=1, padx=5, pady=5)
+
+        self.operation = tk.StringVar(value="set")
+        ttk.Radiobutton(self.fields_frame, text="Set to", value="set", variable=self.operation,
+                        command=self._on_operation_change).grid(row=2, column=0, sticky="w")
+        ttk.Radiobutton(self.fields_frame, text="Replace", value="replace", variable=self.operation,
+                        command=self._on_operation_change).grid(row=3, column=0, sticky="w")
+        self.find_entry = ttk.Entry(self.fields_frame, width=40, font=font, state="disabled")
+        self.find_entry.grid(row=3, column=3, padx=5, pady=5)
+        tk.Label(self.fields_frame, bg=bg, text="New value", font=font).grid(row=4, column=0, sticky="w")
+        self.value_entry = ttk.Entry(self.fields_frame, width=40, font=font)
+        self.value_entry.grid(row=4, column=3, padx=5, pady=5)
+
+        # ----- Preview and progress -----
+        self.status_label = tk.Label(self.top, bg=bg, text="", font=font)
+        self.status_label.pack(padx=10, pady=5)
+        self.progress_bar = ttk.Progressbar(self.top, orient="horizontal", length=500, mode="determinate")
+        self.progress_bar.pack(padx=10, pady=5)
+
+        self.button_frame = tk.Frame(self.top, bg=bg)
+        self.button_frame.pack()
+
+        self.preview_button = ttk.Button(self.button_frame, text="Preview", width=10, command=self._preview)
+        self.preview_button.pack(side="left", padx=10, pady=10)
+        self.apply_button = ttk.Button(self.button_frame, text="Apply", width=10, command=self._apply)
+        self.apply_button.pack(side="left", padx=10, pady=10)
+        self.close_button = ttk.Button(self.button_frame, text="Close", width=10, command=self.top.destroy)
+        self.close_button.pack(side="right", padx=10, pady=10)
+
+        # ----- Earlier bulk edits -----
+        self.undo_frame = ttk.LabelFrame(self.top, text="Earlier bulk edits")
+        self.undo_frame.pack(fill="x", padx=10, pady=10)
+
+        self.edits_tree = ttk.Treeview(self.undo_frame, columns=("created", "description", "count"),
+                                       show="headings", selectmode="browse", height=5)
+        self.edits_tree.heading("created", text="Time")
+        self.edits_tree.heading("description", text="Change")
+        self.edits_tree.heading("count", text="Contacts")
+        self.edits_tree.column("created", width=170)
+        self.edits_tree.column("description", width=550)
+        self.edits_tree.column("count", width=80)
+        self.edits_tree.pack(fill="x", padx=5, pady=5)
+        self.undo_button = ttk.Button(self.undo_frame, text="Undo", width=10, command=self._undo)
+        self.undo_button.pack(padx=5, pady=5)
+
+        self.top.geometry("+500+150")
+
+        self.top.bind_class("TButton", "<Return>", lambda event: event.widget.invoke())
+        self.filter_entry.focus()
+
+        self._show_bulk_edits()
+
+    def _on_operation_change(self):
+        self.find_entry.configure(state="normal" if self.operation.get() == "replace" else "disabled")
+
+    def _get_edit(self):
+        find_text = self.find_entry.get() if self.operation.get() == "replace" else None
+        if find_text == "":
+            messagebox.showerror("Bulk edit", "Enter the text to replace.", parent=self.top)
+            return None
+        return self.filter_field_box.get(), self.filter_entry.get(), self.field_box.get(), \
+            self.value_entry.get(), find_text
+
+    def _preview(self):
+        edit = self._get_edit()
+        if edit is None:
+            return None
+
+        matching, affected = self.contact.preview_bulk_edit(*edit)
+        self.status_label.configure(text=f"{matching} contacts match the filter, {affected} will be changed.")
+        return affected
+
+    def _apply(self):
+        edit = self._get_edit()
+        if edit is None:
+            return
+        affected = self._preview()
+        if not affected:
+            return
+        if not messagebox.askokcancel("Bulk edit", f"Are you sure you want to change {affected} contacts?",
+                                      parent=self.top):
+            return
+
+        self.progress_bar.configure(value=0, maximum=affected)
+        edit_id, count = self.contact.bulk_edit(*edit, progress=self._on_progress)
+        self.status_label.configure(text=f"Changed {count} contacts.")
+        self.changed = self.changed or count > 0
+        self._show_bulk_edits()
+
+    def _on_progress(self, done, total):
+        self.progress_bar.configure(value=done, maximum=total)
+        self.status_label.configure(text=f"Changed {done} of {total} contacts...")
+        self.top.update_idletasks()
+
+    def _undo(self):
+        selection = self.edits_tree.selection()
+        if not selection:
+            return
+        if not messagebox.askokcancel("Bulk edit", "Are you sure you want to undo the selected bulk edit?",
+                                      parent=self.top):
+            return
+
+        restored, skipped = self.contact.undo_bulk_edit(int(selection[0]))
+        if skipped:
+            self.status_label.configure(text=f"Restored {restored} contacts. {skipped} contacts were changed again "
+                                             f"after the bulk edit and were left alone. Undo the newer bulk edits "
+                                             f"first to restore them.")
+        else:
+            self.status_label.configure(text=f"Restored {restored} contacts.")
+        self.changed = self.changed or restored > 0
+        self._show_bulk_edits()
+
+    def _show_bulk_edits(self):
+        self.edits_tree.delete(*self.edits_tree.get_children())
+        for edit_id, description, contact_count, created in self.contact.get_bulk_edits():
+            self.edits_tree.insert("", "end", iid=str(edit_id), values=(created, description, contact_count))
+
+
 class DisplayAndEdit(tk.Tk):
     def __init__(self, *args, **kwargs):
         self.root = super().__init__(*args, **kwargs)
@@ -343,9 +1187,22 @@ class DisplayAndEdit(tk.Tk):
         search_field_frame = tk.Frame(self.frame.interior, bg=bg_color)
         search_field_frame.pack(side="top", padx=5, pady=5)
 
-        self.search_field = CustomComboBox(search_field_frame, self.contact.name_list, width=150, font=text_font)
+        self.contact.prefetcher = PhotoPrefetcher()
+        self.search_field = CustomComboBox(search_field_frame, self.contact.name_list,
+                                           on_suggest=self.contact.prefetcher.prefetch, width=150, font=text_font)
         self.search_field.pack(side="top", padx=5, pady=5)
 
+        tools_frame = tk.Frame(search_field_frame, bg=bg_color)
+        tools_frame.pack(side="top")
+
+        self.birthdays_button = ttk.Button(tools_frame, text="Birthdays", width=10,
+                                           command=self._show_birthdays)
+        self.birthdays_button.pack(side="left", padx=5, pady=5)
+
+        self.bulk_edit_button = ttk.Button(tools_frame, text="Bulk edit", width=10,
+                                           command=self._show_bulk_edit)
+        self.bulk_edit_button.pack(side="left", padx=5, pady=5)
+
         separator = ttk.Separator(search_field_frame, orient="horizontal")
         separator.pack(fill="x", pady=15)
 
@@ -414,8 +1271,34 @@ class DisplayAndEdit(tk.Tk):
         self.edit_button.focus()
 
     def _on_contact_select(self, event):
-        self.contact.get_contact(self.search_field.get())
+        if self.contact.get_contact(self.search_field.get()):
+            contact_id = self._pick_result_popup(self.search_field.get())
+            if contact_id is None:
+                return
+            self.contact.get_contact_by_id(contact_id)
+
+        self._fill_fields()
+
+    def _show_birthdays(self):
+        self.popup = BirthdaysPopUp(self.frame, self.contact)
+        self.frame.wait_window(self.popup.top)
+        if self.popup.result is not None and self.edit_button.winfo_exists():  # Not while a contact is being edited
+            self.contact.get_contact_by_id(self.popup.result)
+            self._fill_fields()
 
+    def _show_bulk_edit(self):
+        self.popup = BulkEditPopUp(self.frame, self.contact)
+        self.frame.wait_window(self.popup.top)
+        if self.popup.changed and self.contact.id is not None and self.edit_button.winfo_exists():
+            self.contact.get_contact_by_id(self.contact.id)  # The shown contact may have been changed
+            self._fill_fields()
+
+    def _pick_result_popup(self, search_name):
+        self.popup = ResultPickerPopUp(self.frame, self.contact, search_name)
+        self.frame.wait_window(self.popup.top)
+        return self.popup.result
+
+    def _fill_fields(self):
         self._change_state("normal")
 
         self._reset_fields()
@@ -450,20 +1333,26 @@ class DisplayAndEdit(tk.Tk):
             return True
 
     def _apply_changes(self):
+        try:
+            birth_date = normalize_date(self.birth_date_text.get("1.0", "end"))
+        except ValueError as error:
+            messagebox.showerror("Invalid birth date", str(error))
+            return
+
         if self._confirm_popup():
             loaded_name = self.contact.name
 
-            try:
-                self.contact.photo = convert_to_binary(self.photo_path_text.get("1.0", "end").rstrip())
-            except FileNotFoundError:
-                if self.photo_path_text.get("1.0", "end").rstrip() != "":
-                    print("FileNotFoundError")
+            self.contact.photo_path = None
+            if os.path.isfile(self.photo_path_text.get("1.0", "end").rstrip()):
+                self.contact.photo_path = self.photo_path_text.get("1.0", "end").rstrip()
+            elif self.photo_path_text.get("1.0", "end").rstrip() != "":
+                print("FileNotFoundError")
 
             self.contact.name = self.name_text.get("1.0", "end").rstrip()
             self.contact.email = self.email_text.get("1.0", "end").rstrip()
             self.contact.phone = self.phone_text.get("1.0", "end").rstrip()
             self.contact.address = self.address_text.get("1.0", "end").rstrip()
-            self.contact.birth_date = self.birth_date_text.get("1.0", "end").rstrip()
+            self.contact.birth_date = birth_date
             self.contact.occupation = self.occupation_text.get("1.0", "end").rstrip()
             self.contact.notes = self.notes_text.get("1.0", "end").rstrip()
 
@@ -500,7 +1389,10 @@ class DisplayAndEdit(tk.Tk):
                                       command=self._enter_edit_mode)
         self.edit_button.pack(padx=5, pady=10)
 
-        self._on_contact_select("required_but_unimportant_param") # ----- Retrieve and refill fields -----
+        # ----- Retrieve and refill fields -----
+        if self.contact.id is not None:
+            self.contact.get_contact_by_id(self.contact.id)
+        self._fill_fields()
 
     def _change_state(self, state, confirm_popup=False):
         self.name_text.configure(state=state)
@@ -528,15 +1420,19 @@ class DisplayAndEdit(tk.Tk):
         self.photo_path_text.insert("end", file_name)
 
     def _draw_photo(self):
-        if self.contact.photo is not None:  # Only draws the photo if there is actually a photo to draw
+        if self.contact.photo_size is not None:  # Only draws the photo if there is actually a photo to draw
             # ===== Load Image =====
-            img = Image.open(io.BytesIO(self.contact.photo))
+            if self.contact.photo_image is not None:  # Already decoded and resized by the prefetcher
+                img = self.contact.photo_image
+            else:
+                with self.contact.open_photo() as blob:  # PIL reads the photo straight from the database
+                    img = Image.open(blob)
 
-            init_width, init_height = img.size
-            img_width, img_height = set_img_size(init_width, init_height)
+                    init_width, init_height = img.size
+                    img = img.resize(set_img_size(init_width, init_height))
 
             # ===== Profile Photo =====
-            photo = ImageTk.PhotoImage(img.resize((img_width, img_height)))
+            photo = ImageTk.PhotoImage(img)
             self.photo_label = tk.Label(self.frame.interior, image=photo, bg=bg_color)
             self.photo_label.image = photo  # Keep a reference so tkinter garbage collector doesn't blanc out the image
             self.photo_label.pack(padx=5, pady=5)
@@ -704,15 +1600,24 @@ class AddContactApp(tk.Tk):
         self.notes_text.configure(state=state)
 
     def _apply_changes(self):
+        try:
+            birth_date = normalize_date(self.birth_date_text.get("1.0", "end"))
+        except ValueError as error:
+            messagebox.showerror("Invalid birth date", str(error))
+            return
+
         if self._confirm_popup("Are you sure you want to commit and add the contact?"):
-            if self.photo_path_text.get("1.0", "end").rstrip() != "":
+            self.contact.photo_path = None
+            if os.path.isfile(self.photo_path_text.get("1.0", "end").rstrip()):
                 print(self.photo_path_text.get("1.0", "end").rstrip())
-                self.contact.photo = convert_to_binary(self.photo_path_text.get("1.0", "end").rstrip())
+                self.contact.photo_path = self.photo_path_text.get("1.0", "end").rstrip()
+            elif self.photo_path_text.get("1.0", "end").rstrip() != "":
+                print("FileNotFoundError")
             self.contact.name = self.name_text.get("1.0", "end").rstrip()
             self.contact.email = self.email_text.get("1.0", "end").rstrip()
             self.contact.phone = self.phone_text.get("1.0", "end").rstrip()
             self.contact.address = self.address_text.get("1.0", "end").rstrip()
-            self.contact.birth_date = self.birth_date_text.get("1.0", "end").rstrip()
+            self.contact.birth_date = birth_date
             self.contact.occupation = self.occupation_text.get("1.0", "end").rstrip()
             self.contact.notes = self.notes_text.get("1.0", "end").rstrip()
 
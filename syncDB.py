@@ -0,0 +1,228 @@
+import argparse
+import hashlib
+import socket
+import sqlite3
+from datesDB import normalize_date
+
+contact_columns = ("name", "email", "phone", "address", "birth_date", "occupation", "notes")
+chunk_size = 64 * 1024  # Photos are copied between the databases in pieces of this many bytes
+
+
+def copy_photo(source, destination) -> str:
+    """
+    Copies a photo between two blobs opened with Connection.blobopen in chunks, so it is never fully in memory \n
+    :param source: The blob to read from
+    :param destination: The blob to write to, which must have the same size
+    :return: The SHA-256 hex digest of the photo
+    """
+    photo_hash = hashlib.sha256()
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        photo_hash.update(chunk)
+        destination.write(chunk)
+    return photo_hash.hexdigest()
+
+
+def export_changes(db, delta_path: str, since: int = 0, source: str = socket.gethostname(), target: str = None) -> int:
+    """
+    Writes every contact changed after a sequence number into a small delta database \n
+    Several changes to the same contact are collapsed into one row holding its current state, and the photo is only
+    included if it changed in the exported range. Changes this database received from the target are left out, so
+    they aren't sent back.
+
+    :param db: A sqlite3 connection to the contacts database with the change log from createDB.py
+    :param delta_path: Path of the delta database file to create
+    :param since: Only changes with a sequence number greater than this are exported
+    :param source: Name of this database, stored in the delta so the receiver can track what it has applied
+    :param target: Name of the receiving database. If None, no changes received from other databases are exported.
+    :return: The last sequence number included in the delta. Use it as "since" for the next export.
+    """
+    delta = sqlite3.connect(delta_path)
+    delta.execute("DROP TABLE IF EXISTS changes")
+    delta.execute("DROP TABLE IF EXISTS meta")
+    delta.execute("CREATE TABLE changes(contact_uuid TEXT PRIMARY KEY NOT NULL, operation TEXT NOT NULL, "
+                  "name TEXT, email TEXT, phone TEXT, address TEXT, birth_date TEXT, occupation TEXT, notes TEXT, "
+                  "photo_sent INTEGER NOT NULL, photo BLOB, photo_hash TEXT)")
+    delta.execute("CREATE TABLE meta(source TEXT NOT NULL, since INTEGER NOT NULL, last_seq INTEGER NOT NULL)")
+
+    # Skipped changes still count as exported, so the next export doesn't look at them again
+    last_seq = db.execute("SELECT IFNULL(MAX(seq), ?) FROM contacts_changelog WHERE seq > ?",
+                          (since, since)).fetchone()[0]
+    if target is None:
+        origin_str, origin_params = "log.origin IS NULL", ()
+    else:
+        origin_str, origin_params = "(log.origin IS NULL OR log.origin != ?)", (target,)
+
+    cursor = db.cursor()
+    cursor.execute("SELECT log.contact_uuid, MAX(log.photo_changed), c.id, "
+                   + ", ".join("c." + column for column in contact_columns) + ", "
+                   "length(c.photo) "
+                   "FROM contacts_changelog AS log LEFT JOIN contacts AS c ON c.uuid = log.contact_uuid "
+                   f"WHERE log.seq > ? AND log.seq <= ? AND log.contact_uuid IS NOT NULL AND {origin_str} "
+                   "GROUP BY log.contact_uuid", (since, last_seq, *origin_params))
+
+    while True:
+        rows = cursor.fetchmany(100)
+        if not rows:
+            break
+        for row in rows:
+            contact_uuid, photo_changed, current_id = row[:3]
+            values, photo_size = row[3:-1], row[-1]
+
+            if current_id is None:  # The contact doesn't exist anymore
+                delta.execute("INSERT INTO changes(contact_uuid, operation, photo_sent) VALUES (?, 'delete', 0)",
+                              (contact_uuid,))
+            else:
+                # Space for the photo is reserved with zeroblob() and filled in chunks straight from the database
+                send_photo = photo_changed and photo_size is not None
+                delta_cursor = delta.execute("INSERT INTO changes(contact_uuid, operation, " +
+                                             ", ".join(contact_columns) + ", photo_sent, photo) "
+                                             "VALUES (?, 'upsert', ?, ?, ?, ?, ?, ?, ?, ?, "
+                                             "CASE WHEN ? THEN zeroblob(?) END)",
+                                             (contact_uuid, *values, photo_changed, send_photo, photo_size))
+                if send_photo:
+                    with db.blobopen("contacts", "photo", current_id, readonly=True) as source_blob, \
+                            delta.blobopen("changes", "photo", delta_cursor.lastrowid) as destination_blob:
+                        sent_hash = copy_photo(source_blob, destination_blob)
+                    delta.execute("UPDATE changes SET photo_hash = ? WHERE rowid = ?",
+                                  (sent_hash, delta_cursor.lastrowid))
+    cursor.close()
+
+    delta.execute("INSERT INTO meta(source, since, last_seq) VALUES (?, ?, ?)", (source, since, last_seq))
+    delta.commit()
+    delta.close()
+    return last_seq
+
+
+def apply_changes(db, delta_path: str) -> int:
+    """
+    Applies a delta database created by export_changes in a single transaction \n
+    Contacts are matched by their uuid, so contacts added on different machines never replace each other. The
+    changes are logged with the source as their origin, so they aren't exported back to it.
+
+    :param db: A sqlite3 connection to the contacts database with the change log from createDB.py
+    :param delta_path: Path of the delta database file
+    :return: The number of contacts changed
+    """
+    delta = sqlite3.connect(delta_path)
+    source, since, last_seq = delta.execute("SELECT source, since, last_seq FROM meta").fetchone()
+
+    applied = db.execute("SELECT last_seq FROM sync_state WHERE source = ?", (source,)).fetchone()
+    if applied is not None and applied[0] < since:
+        print(f"------! The delta starts at sequence number {since}, but only changes up to {applied[0]} from "
+              f"'{source}' have been applied. Some changes may be missing.")
+
+    update_str = ", ".join(f"{column} = excluded.{column}" for column in contact_columns)
+    upsert_str = "INSERT INTO contacts(uuid, " + ", ".join(contact_columns) + ") VALUES (?, ?, ?, ?, ?, ?, ?, ?) " \
+                 "ON CONFLICT(uuid) DO UPDATE SET " + update_str
+
+    count = 0
+    cursor = delta.execute("SELECT contact_uuid, operation, " + ", ".join(contact_columns) +
+                           ", photo_sent, length(photo), photo_hash, rowid FROM changes "
+                           "ORDER BY contact_uuid")
+    with db:  # Commits everything at once, or rolls back if anything fails
+        db.execute("INSERT INTO sync_applying(source) VALUES (?)", (source,))
+        while True:
+            rows = cursor.fetchmany(100)
+            if not rows:
+                break
+            for row in rows:
+                contact_uuid, operation = row[:2]
+                values = list(row[2:-4])
+                birth_date_index = contact_columns.index("birth_date")
+                if values[birth_date_index]:
+                    try:
+                        values[birth_date_index] = normalize_date(values[birth_date_index])
+                    except ValueError:
+                        print(f"------! The birth date '{values[birth_date_index]}' of contact {contact_uuid} "
+                              f"isn't a valid date. It is stored as it is and left out of the birthday queries.")
+                photo_sent, photo_size, sent_hash, delta_rowid = row[-4:]
+
+                if operation == "delete":
+                    db.execute("DELETE FROM contacts WHERE uuid = ?", (contact_uuid,))
+                else:
+                    db.execute(upsert_str, (contact_uuid, *values))
+                    if photo_sent:
+                        if photo_size is None:
+                            db.execute("UPDATE contacts SET photo = NULL WHERE uuid = ?", (contact_uuid,))
+                        else:
+                            # The photo is copied in chunks into space reserved with zeroblob(), and checked on the way
+                            db.execute("UPDATE contacts SET photo = zeroblob(?) WHERE uuid = ?",
+                                       (photo_size, contact_uuid))
+                            contact_id = db.execute("SELECT id FROM contacts WHERE uuid = ?",
+                                                    (contact_uuid,)).fetchone()[0]
+                            with delta.blobopen("changes", "photo", delta_rowid, readonly=True) as source_blob, \
+                                    db.blobopen("contacts", "photo", contact_id) as destination_blob:
+                                if copy_photo(source_blob, destination_blob) != sent_hash:
+                                    raise ValueError(f"The photo for contact {contact_uuid} in '{delta_path}' "
+                                                     f"is corrupt.")
+                count += 1
+
+        db.execute("DELETE FROM sync_applying")
+        db.execute("INSERT INTO sync_state(source, last_seq) VALUES (?, ?) "
+                   "ON CONFLICT(source) DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq)", (source, last_seq))
+
+    delta.close()
+    return count
+
+
+def init_copy(db, copy_path: str, source: str = socket.gethostname()) -> int:
+    """
+    Writes a full copy of the database to set up another machine for syncing \n
+    Every copy must start from the same migrated database, since createDB.py gives each contact a random uuid. The
+    copy replaces any older database at copy_path, and already has every change up to now marked as received from
+    the source, so they aren't exported back to it.
+
+    :param db: A sqlite3 connection to the contacts database with the change log from createDB.py
+    :param copy_path: Path of the database file to create
+    :param source: Name of this database, used as the source of the deltas exported to the copy
+    :return: The last sequence number in the copy. Use it as "since" for the first export to the copy.
+    """
+    copy = sqlite3.connect(copy_path)
+    db.backup(copy)
+    last_seq = copy.execute("SELECT IFNULL(MAX(seq), 0) FROM contacts_changelog").fetchone()[0]
+    with copy:
+        copy.execute("UPDATE contacts_changelog SET origin = ? WHERE origin IS NULL", (source,))
+        copy.execute("INSERT INTO sync_state(source, last_seq) VALUES (?, ?) "
+                     "ON CONFLICT(source) DO UPDATE SET last_seq = excluded.last_seq", (source, last_seq))
+    copy.close()
+    return last_seq
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync contacts between copies of the database by only sending "
+                                                 "the changes.")
+    parser.add_argument("--db", default="contacts.db", help="The contacts database to export from or apply to")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export the changes after a sequence number")
+    export_parser.add_argument("delta", help="Path of the delta file to create")
+    export_parser.add_argument("--since", type=int, default=0, help="Last sequence number the receiver has")
+    export_parser.add_argument("--source", default=socket.gethostname(), help="Name of this database")
+    export_parser.add_argument("--target", help="Name of the receiving database. Changes received from it are not "
+                                                "sent back. Without it, no received changes are exported")
+
+    apply_parser = subparsers.add_parser("apply", help="Apply a delta file created with 'export'")
+    apply_parser.add_argument("delta", help="Path of the delta file to apply")
+
+    init_parser = subparsers.add_parser("init", help="Create a full copy of the database for another machine")
+    init_parser.add_argument("copy", help="Path of the database file to create. An existing file is replaced")
+    init_parser.add_argument("--source", default=socket.gethostname(), help="Name of this database")
+
+    args = parser.parse_args()
+
+    dbConn = sqlite3.connect(args.db)
+    if args.command == "export":
+        seq = export_changes(dbConn, args.delta, args.since, args.source, args.target)
+        print(f"Exported changes {args.since + 1} to {seq} into:\t", args.delta)
+        print(f"Use '--since {seq}' for the next export.")
+    elif args.command == "apply":
+        changed = apply_changes(dbConn, args.delta)
+        print(f"Applied {changed} changed contacts from:\t", args.delta)
+    else:
+        seq = init_copy(dbConn, args.copy, args.source)
+        print("Created a copy of the database in:\t", args.copy)
+        print(f"Use '--since {seq} --target <name of the copy>' for the first export to it.")
+    dbConn.close()